@@ -1,91 +1,190 @@
+import hashlib
+import re
+import warnings
+from dataclasses import dataclass, field
 import streamlit as st
 import numpy as np
-import pandas as pd
-import plotly.graph_objects as go # Para gráficos interactivos
+from kernels import PRICE_DTYPE, fused_last, rolling_mean_online, rolling_minmax, rolling_minmax_table # Kernels numéricos compilados (Numba)
+
+# --- Niveles de Alerta ---
+# Bandas [2, 5), [5, 10) y [10, inf): `np.searchsorted(..., side='right')` da el índice de banda
+# (0 = sin alerta) con el que se eligen el campo de `PredictionResults` y el mensaje.
+
+ALERT_LEVELS = np.array([2.00, 5.00, 10.00])
+ALERT_KEYS = (None, "alert_2_0_message", "alert_5_0_message", "alert_10_0_message")
+ACTUAL_ALERT_MSGS = (
+    None,
+    "🟢 **¡Alerta Importante!** El valor actual ({:.4f}) es igual o mayor a **2.00**. ¡Buen punto!",
+    "🚨 **¡ALERTA!** El valor actual ({:.4f}) es igual o mayor a **5.00**.",
+    "🔥🔥 **¡ALERTA MÁXIMA!** El valor actual ({:.4f}) es igual o mayor a **10.00**. ¡EXTREMA ATENCIÓN!",
+)
+RESISTANCE_ALERT_MSGS = (
+    None,
+    "🔵 **Nota:** El nivel de resistencia detectado ({:.4f}) es igual o mayor a **2.00**.",
+    "🔔 **Advertencia:** El nivel de resistencia detectado ({:.4f}) es igual o mayor a **5.00**.",
+    "🔔 **Advertencia Alta:** El nivel de resistencia detectado ({:.4f}) es igual o mayor a **10.00**. ¡Potencialmente muy alto!",
+)
+
+# --- Mensajes del Informe ---
+# Plantillas fijas; las que llevan valores se completan con `.format`.
+
+WINDOW_ADJUSTED_MSG = "ℹ️ **Nota:** La ventana deseada de `{}` para S/R es mayor que los datos disponibles (`{}`). Se ajustó la ventana a `{}`."
+TENDENCY_MSGS = {
+    "Alcista": "🚀 **TENDENCIA:** ¡Actualmente estamos en una tendencia **ALCISTA**!",
+    "Bajista": "📉 **TENDENCIA:** Se ha detectado una tendencia **BAJISTA**.",
+    "Estable": "↔️ **TENDENCIA:** La tendencia actual parece **ESTABLE**.",
+}
+TENDENCY_OTHER_MSG = "⚠️ **TENDENCIA:** {} (Necesitas más datos para un análisis de tendencia fiable)."
+PREDICTION_UP_MSG = "📈 **PREDICCIÓN:** Se espera un movimiento **MAYOR a {:.4f}** (cerca del soporte)."
+PREDICTION_DOWN_MSG = "📉 **PREDICCIÓN:** Se espera un movimiento **MENOR a {:.4f}** (cerca de la resistencia)."
+PREDICTION_UNCERTAIN_MSG = "🤔 **PREDICCIÓN:** El valor actual está entre soporte y resistencia. La dirección es **INCIERTA**."
+
+# --- Resultado de la Predicción ---
+
+@dataclass(slots=True)
+class PredictionResults:
+    """
+    Mensajes y valores que produce `get_prediction_and_alerts`, en el orden en que se muestran.
+    Se rellena de forma incremental; los mensajes que no aplican quedan en None.
+    """
+    prediction_sr_message: str | None = None
+    alert_2_0_message: str | None = None
+    alert_5_0_message: str | None = None
+    alert_10_0_message: str | None = None
+    tendency_message: str | None = None
+    analysis_current: dict = field(default_factory=dict) # Para soporte, resistencia, actual, etc.
+    adjusted_window: int | None = None # Ventana S/R efectiva, reutilizada por el gráfico
+    warnings: list = field(default_factory=list)
 
 # --- Funciones de Lógica de Trading ---
 
-def detectar_soporte_resistencia(data: pd.Series, window: int):
+def _clamp_window(window: int, n: int) -> int:
+    """
+    Ventana S/R efectiva para `n` datos: nunca mayor que los datos disponibles y de al menos 2
+    cuando hay dos o más puntos (con ventana 1, soporte y resistencia serían el propio valor).
+    """
+    return max(1, min(max(2, window), n))
+
+def _chart_min_periods(window: int, n: int) -> int:
+    """
+    `min_periods` de las series S/R del gráfico. Se exigen ventanas completas
+    (`min_periods=window`, como pandas) solo cuando quedan al menos `window` puntos con
+    valor; si no, se rebaja lo justo para dibujar `window` puntos (o la serie entera).
+    Así el número de puntos dibujados nunca baja al crecer la serie.
+    """
+    return max(1, min(window, n - window + 1))
+
+@st.cache_data(ttl=600, max_entries=8)
+def detectar_soporte_resistencia(_data: np.ndarray, data_key: str, window: int):
     """
     Calcula soporte y resistencia como el mínimo y máximo de una ventana móvil.
     Ajusta dinámicamente la ventana si hay menos datos de los solicitados.
+    Los primeros puntos sin ventana suficiente quedan en NaN (Plotly no los dibuja); con
+    series cortas se aceptan ventanas parciales (ver `_chart_min_periods`).
+    La predicción no los usa: lee la cola con `fused_last`.
+    Usa el kernel compilado `rolling_minmax` (una sola pasada para ambos niveles).
+    El resultado se cachea por `data_key` y la ventana; Streamlit no hashea `_data`.
     
     Args:
-        data (pd.Series): Serie de datos de precios.
+        _data (np.ndarray): Array de precios.
+        data_key (str): Clave de contenido de `_data` (ver `_parse_series`).
         window (int): Tamaño deseado de la ventana.
         
     Returns:
-        tuple: (soporte, resistencia) como Series de Pandas.
+        tuple: (soporte, resistencia) como arrays de NumPy.
     """
-    actual_window = max(1, min(window, len(data)))
-    if len(data) == 0:
-        return pd.Series([]), pd.Series([]) 
-    
-    soporte = data.rolling(window=actual_window, min_periods=1).min()
-    resistencia = data.rolling(window=actual_window, min_periods=1).max()
+    arr = np.asarray(_data, dtype=PRICE_DTYPE)
+    if arr.size == 0:
+        return np.empty(0, PRICE_DTYPE), np.empty(0, PRICE_DTYPE)
+    actual_window = _clamp_window(window, arr.size)
+    soporte, resistencia = rolling_minmax(arr, actual_window, _chart_min_periods(actual_window, arr.size))
     
     return soporte, resistencia
 
-def analizar_tendencia(data: pd.Series, short_sma_window: int = 5, long_sma_window: int = 20):
+def detectar_soporte_resistencia_table(data: np.ndarray, window: int):
     """
-    Analiza la tendencia de los datos usando Medias Móviles Simples (SMA).
+    Calcula soporte y resistencia para varias series a la vez (una por columna, p. ej. varios
+    activos), con las mismas reglas de ventana que `detectar_soporte_resistencia`.
+    Las columnas se procesan en paralelo.
     
     Args:
-        data (pd.Series): Serie de datos de precios.
-        short_sma_window (int): Ventana para la SMA corta.
-        long_sma_window (int): Ventana para la SMA larga.
+        data (np.ndarray): Matriz de precios de forma (n_puntos, n_series).
+        window (int): Tamaño deseado de la ventana.
         
     Returns:
-        str: "Alcista", "Bajista", "Estable" o "Insuficientes datos".
+        tuple: (soporte, resistencia) como matrices con la forma de `data`.
     """
-    if len(data) < long_sma_window:
-        return "Insuficientes datos para tendencia"
+    arr = np.asarray(data, dtype=PRICE_DTYPE)
+    actual_window = _clamp_window(window, arr.shape[0])
+    return rolling_minmax_table(arr, actual_window, _chart_min_periods(actual_window, arr.shape[0]))
 
-    sma_short = data.rolling(window=short_sma_window, min_periods=1).mean()
-    sma_long = data.rolling(window=long_sma_window, min_periods=1).mean()
+@st.cache_data(ttl=600, max_entries=8)
+def _sma(_data: np.ndarray, data_key: str, window: int):
+    """
+    Serie completa de la Media Móvil Simple (solo para el gráfico), con ventana parcial al
+    inicio (`min_periods=1`), así la SMA se dibuja desde el primer punto.
+    Se cachea por `data_key` y la ventana, igual que `detectar_soporte_resistencia`.
+    
+    Args:
+        _data (np.ndarray): Array de precios.
+        data_key (str): Clave de contenido de `_data` (ver `_parse_series`).
+        window (int): Ventana de la SMA.
+        
+    Returns:
+        np.ndarray: SMA móvil (float64) con la longitud de `_data`.
+    """
+    return rolling_mean_online(np.asarray(_data, dtype=PRICE_DTYPE), window, 1)
 
-    if data.iloc[-1] > sma_short.iloc[-1] and sma_short.iloc[-1] > sma_long.iloc[-1]:
+def analizar_tendencia(actual: float, sma_short: float, sma_long: float):
+    """
+    Analiza la tendencia comparando el valor actual con el último valor de las Medias
+    Móviles Simples (SMA). Las SMAs llegan ya calculadas (`fused_last`); la comprobación
+    de datos suficientes la hace `get_prediction_and_alerts`.
+    
+    Args:
+        actual (float): Último precio.
+        sma_short (float): Último valor de la SMA corta.
+        sma_long (float): Último valor de la SMA larga.
+        
+    Returns:
+        str: "Alcista", "Bajista" o "Estable".
+    """
+    if actual > sma_short and sma_short > sma_long:
         return "Alcista"
-    elif data.iloc[-1] < sma_short.iloc[-1] and sma_short.iloc[-1] < sma_long.iloc[-1]:
+    elif actual < sma_short and sma_short < sma_long:
         return "Bajista"
     else:
         return "Estable"
 
 # Esta función ahora no imprime directamente, sino que retorna los mensajes para control externo
-def get_prediction_and_alerts(data: pd.Series, target_value: float, window: int, umbral: float,
+def get_prediction_and_alerts(data: np.ndarray, target_value: float, window: int, umbral: float,
                                short_sma_window: int, long_sma_window: int):
     """
-    Calcula la predicción, análisis y alertas, retornándolos para su impresión ordenada.
+    Calcula la predicción, análisis y alertas, retornándolos en un `PredictionResults` para su impresión ordenada.
     """
-    results = {
-        "prediction_sr_message": None,
-        "alert_2_0_message": None,
-        "alert_5_0_message": None,
-        "alert_10_0_message": None,
-        "tendency_message": None,
-        "analysis_current": {}, # Para soporte, resistencia, actual, etc.
-        "warnings": []
-    }
+    results = PredictionResults()
 
-    if len(data) == 0:
-        results["warnings"].append("⚠️ **Error:** No hay datos para predecir.")
+    # Acepta cualquier secuencia (lista, pd.Series...): sin copia si ya es un array de PRICE_DTYPE
+    data = np.asarray(data, dtype=PRICE_DTYPE)
+    if data.size == 0:
+        results.warnings.append("⚠️ **Error:** No hay datos para predecir.")
         return results
     
     # --- Manejar 'menos coeficientes' / ventana dinámica para S/R ---
-    adjusted_window = max(2, min(window, len(data)))
-    if len(data) == 1: 
-        adjusted_window = 1
-        results["warnings"].append("ℹ️ **Nota:** Con un solo punto de datos, el soporte y la resistencia son el mismo valor. La predicción será limitada.")
+    adjusted_window = _clamp_window(window, data.size)
+    if data.size <= 2:
+        results.warnings.append("ℹ️ **Nota:** Con uno o dos datos el valor actual siempre coincide con el soporte o la resistencia. Se necesitan al menos 3 para una predicción S/R.")
     elif adjusted_window < window:
-        results["warnings"].append(f"ℹ️ **Nota:** La ventana deseada de `{window}` para S/R es mayor que los datos disponibles (`{len(data)}`). Se ajustó la ventana a `{adjusted_window}`.")
+        results.warnings.append(WINDOW_ADJUSTED_MSG.format(window, data.size, adjusted_window))
 
-    soporte, resistencia = detectar_soporte_resistencia(data, adjusted_window)
-    
-    actual = data.iloc[-1]
-    soporte_actual = soporte.iloc[-1]
-    resistencia_actual = resistencia.iloc[-1]
+    results.adjusted_window = adjusted_window
 
-    results["analysis_current"] = {
+    # Solo se necesitan los valores del último punto: S/R, ambas SMAs y el valor actual
+    # salen de un único recorrido de la cola (kernel `fused_last`)
+    soporte_actual, resistencia_actual, sma_short, sma_long, actual = fused_last(
+        data, adjusted_window, short_sma_window, long_sma_window)
+
+    results.analysis_current = {
         "actual": actual,
         "soporte": soporte_actual,
         "resistencia": resistencia_actual,
@@ -94,46 +193,171 @@ def get_prediction_and_alerts(data: pd.Series, target_value: float, window: int,
     }
 
     # --- Alertas para valores altos (10.00, 5.00, 2.00) ---
-    if actual >= 10.00:
-        results["alert_10_0_message"] = f"🔥🔥 **¡ALERTA MÁXIMA!** El valor actual ({actual:.4f}) es igual o mayor a **10.00**. ¡EXTREMA ATENCIÓN!"
-    elif resistencia_actual >= 10.00:
-        results["alert_10_0_message"] = f"🔔 **Advertencia Alta:** El nivel de resistencia detectado ({resistencia_actual:.4f}) es igual o mayor a **10.00**. ¡Potencialmente muy alto!"
-    
-    if actual >= 5.00 and actual < 10.00: 
-        results["alert_5_0_message"] = f"🚨 **¡ALERTA!** El valor actual ({actual:.4f}) es igual o mayor a **5.00**."
-    elif resistencia_actual >= 5.00 and resistencia_actual < 10.00: 
-        results["alert_5_0_message"] = f"🔔 **Advertencia:** El nivel de resistencia detectado ({resistencia_actual:.4f}) es igual o mayor a **5.00**."
-
-    if actual >= 2.00 and actual < 5.00: # Se ejecuta solo si no es ya >= 5.00 o >= 10.00
-        results["alert_2_0_message"] = f"🟢 **¡Alerta Importante!** El valor actual ({actual:.4f}) es igual o mayor a **2.00**. ¡Buen punto!"
-    elif resistencia_actual >= 2.00 and resistencia_actual < 5.00:
-        results["alert_2_0_message"] = f"🔵 **Nota:** El nivel de resistencia detectado ({resistencia_actual:.4f}) es igual o mayor a **2.00**."
+    # Cada valor cae en una sola banda; la del valor actual tiene prioridad sobre la de la resistencia
+    nivel_actual = int(np.searchsorted(ALERT_LEVELS, actual, side='right'))
+    nivel_resistencia = int(np.searchsorted(ALERT_LEVELS, resistencia_actual, side='right'))
+    if nivel_actual:
+        setattr(results, ALERT_KEYS[nivel_actual], ACTUAL_ALERT_MSGS[nivel_actual].format(actual))
+    if nivel_resistencia and nivel_resistencia != nivel_actual:
+        setattr(results, ALERT_KEYS[nivel_resistencia], RESISTANCE_ALERT_MSGS[nivel_resistencia].format(resistencia_actual))
+
+    # Entrada trivial: se informa el valor y sus alertas, sin tendencia ni predicción S/R
+    if data.size <= 2:
+        results.tendency_message = TENDENCY_OTHER_MSG.format("Insuficientes datos para tendencia")
+        results.prediction_sr_message = "⚠️ **PREDICCIÓN:** Insuficientes datos para una predicción basada en soporte y resistencia."
+        return results
 
     # --- Análisis de Tendencia ---
-    tendencia = analizar_tendencia(data, short_sma_window, long_sma_window)
-    if tendencia == "Alcista":
-        results["tendency_message"] = f"🚀 **TENDENCIA:** ¡Actualmente estamos en una tendencia **ALCISTA**!"
-    elif tendencia == "Bajista":
-        results["tendency_message"] = f"📉 **TENDENCIA:** Se ha detectado una tendencia **BAJISTA**."
-    elif tendencia == "Estable":
-        results["tendency_message"] = f"↔️ **TENDENCIA:** La tendencia actual parece **ESTABLE**."
+    if data.size < long_sma_window:
+        tendencia = "Insuficientes datos para tendencia"
     else:
-        results["tendency_message"] = f"⚠️ **TENDENCIA:** {tendencia} (Necesitas más datos para un análisis de tendencia fiable)."
-
-    # Validación final para la predicción S/R principal
-    if np.isnan(soporte_actual) or np.isnan(resistencia_actual):
-        results["warnings"].append("⚠️ **Advertencia:** Los niveles de soporte/resistencia no se pudieron calcular completamente con los datos/ventana actuales. La predicción basada en S/R puede ser menos precisa.")
-        results["prediction_sr_message"] = "Insuficientes datos o S/R no calculable"
+        tendencia = analizar_tendencia(actual, sma_short, sma_long)
+    if tendencia in TENDENCY_MSGS:
+        results.tendency_message = TENDENCY_MSGS[tendencia]
+    else:
+        results.tendency_message = TENDENCY_OTHER_MSG.format(tendencia)
+
+    # Predicción S/R principal. Con datos no vacíos y finitos (garantizado por
+    # `_parse_series`) el soporte y la resistencia siempre son calculables.
+    if actual <= soporte_actual + umbral:
+        results.prediction_sr_message = PREDICTION_UP_MSG.format(target_value)
+    elif actual >= resistencia_actual - umbral:
+        results.prediction_sr_message = PREDICTION_DOWN_MSG.format(target_value)
     else:
-        if actual <= soporte_actual + umbral:
-            results["prediction_sr_message"] = f"📈 **PREDICCIÓN:** Se espera un movimiento **MAYOR a {target_value:.4f}** (cerca del soporte)."
-        elif actual >= resistencia_actual - umbral:
-            results["prediction_sr_message"] = f"📉 **PREDICCIÓN:** Se espera un movimiento **MENOR a {target_value:.4f}** (cerca de la resistencia)."
-        else:
-            results["prediction_sr_message"] = "🤔 **PREDICCIÓN:** El valor actual está entre soporte y resistencia. La dirección es **INCIERTA**."
+        results.prediction_sr_message = PREDICTION_UNCERTAIN_MSG
     
     return results
 
+@st.cache_data(ttl=600, max_entries=8, show_spinner=False)
+def _prediction_cached(_data: np.ndarray, data_key: str, target_value: float, window: int, umbral: float,
+                       short_sma_window: int, long_sma_window: int):
+    """
+    `get_prediction_and_alerts` cacheada por `data_key` y los parámetros: repetir la
+    predicción sin cambios devuelve el informe guardado sin recalcular.
+    """
+    return get_prediction_and_alerts(_data, target_value, window, umbral, short_sma_window, long_sma_window)
+
+# --- Procesamiento de la Entrada ---
+
+_SEPARADOR = re.compile(r'\s*,\s*') # Coma con los espacios que la rodean
+
+@st.cache_data(ttl=600, max_entries=8, show_spinner=False)
+def _parse_series(datos_str: str):
+    """
+    Convierte el texto de entrada (valores separados por comas) en un array de precios en
+    PRICE_DTYPE (float64), los mismos valores que se escribieron.
+    Se cachea por el texto crudo, así los reruns provocados por los sliders no vuelven a parsear.
+    Lanza ValueError si algún valor no es numérico o no es finito (nan/inf).
+    
+    Returns:
+        tuple: (array de precios, clave de contenido). La clave es un digest del buffer que
+        identifica al array en las funciones cacheadas, evitando que Streamlit lo rehashee.
+    """
+    # `np.fromstring` convierte sin avisar los tokens de solo espacios en -1.0 ("1,2, " -> [1, 2, -1]):
+    # antes se quitan los espacios junto a las comas y las comas de los extremos
+    normalizado = _SEPARADOR.sub(',', datos_str.strip()).strip(',')
+    arr = None
+    if ',,' not in normalizado:
+        try:
+            # Tokenizado y conversión en C, directamente al buffer de precios. Antes de NumPy 2.3
+            # un token inválido no lanza ValueError: avisa con DeprecationWarning y devuelve solo
+            # lo leído hasta ahí ("1,2abc" -> [1, 2]); el aviso se trata como error
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', DeprecationWarning)
+                arr = np.fromstring(normalizado, sep=',', dtype=PRICE_DTYPE) if normalizado else np.empty(0, PRICE_DTYPE)
+        except (ValueError, DeprecationWarning):
+            pass
+    if arr is None:
+        # Tokens vacíos ("1,,2", "1, ,2") o valores que NumPy no acepta: ruta tolerante en Python,
+        # que vuelve a lanzar ValueError si algún valor realmente no es numérico
+        arr = np.array([float(x.strip()) for x in datos_str.split(',') if x.strip()], dtype=PRICE_DTYPE)
+    if not np.isfinite(arr).all():
+        raise ValueError("La entrada contiene valores no finitos")
+    return arr, hashlib.blake2b(arr.tobytes(), digest_size=16).hexdigest()
+
+# --- Visualización ---
+
+# Color de texto de Streamlit (`:color[...]`) para cada nivel de mensaje del informe
+MESSAGE_COLORS = {"success": "green", "error": "red", "info": "blue", "warning": "orange"}
+
+# Bloque "Análisis Actual": claves de `analysis_current`, sus etiquetas y el formato numérico
+ANALYSIS_FIELDS = ("actual", "soporte", "resistencia", "target", "umbral")
+ANALYSIS_LABELS = ("Valor actual", "Soporte detectado", "Resistencia detectada",
+                   "Valor Objetivo de Comparación", "Umbral de sensibilidad")
+VALUE_FMT = "%.4f"
+
+# Líneas horizontales del gráfico: (y, estilo, color, texto, x, xanchor, yanchor). La posición
+# del texto reproduce la de `add_hline` ("top left" = x 0, anclado abajo a la izquierda, etc.)
+ALERT_HLINES = (
+    (2.00, "dot", "blue", "Alerta 2.00", 0, "left", "bottom"),
+    (5.00, "dash", "orange", "Alerta 5.00", 1, "right", "top"),
+    (10.00, "dashdot", "red", "Alerta 10.00", 0, "left", "bottom"),
+)
+
+@st.cache_data(ttl=600, max_entries=8)
+def build_fig(_data: np.ndarray, data_key: str, window: int, target_value: float,
+              short_sma_window: int, long_sma_window: int):
+    """
+    Construye el gráfico de precios con soporte, resistencia, SMAs y líneas de alerta.
+    Se cachea por sus entradas: repetir la predicción sin cambios no reconstruye la figura.
+    
+    Args:
+        _data (np.ndarray): Array de precios (no se hashea; se identifica por `data_key`).
+        data_key (str): Clave de contenido de `_data` (ver `_parse_series`).
+        window (int): Ventana S/R ya ajustada (la misma que usó la predicción).
+        target_value (float): Valor objetivo a marcar en el gráfico.
+        short_sma_window (int): Ventana para la SMA corta.
+        long_sma_window (int): Ventana para la SMA larga.
+        
+    Returns:
+        dict: Figura de Plotly serializada, lista para `st.plotly_chart`.
+    """
+    # Plotly se importa aquí y no al inicio: los reruns de los sliders no pagan su carga.
+    # Tras la primera predicción el módulo queda en `sys.modules`.
+    import plotly.graph_objects as go # Para gráficos interactivos
+
+    # La ventana llega ya ajustada por la predicción: una única pasada móvil
+    soporte_line, resistencia_line = detectar_soporte_resistencia(_data, data_key, window)
+
+    xs = np.arange(len(_data), dtype=np.int32) # Eje X compartido por todas las trazas
+    # Con muchos puntos el renderizado SVG domina: se pasa a WebGL
+    trace_cls = go.Scattergl if len(_data) > 1000 else go.Scatter
+    # Las trazas se reúnen en una lista y la figura se crea de una vez: sin `add_trace`
+    # por serie (cada uno revalida y copia el estado de la figura)
+    traces = [
+        trace_cls(x=xs, y=_data, mode='lines+markers', name='Precios', line=dict(color='blue')),
+        trace_cls(x=xs, y=soporte_line, mode='lines', name='Soporte', line=dict(color='green', dash='dot')),
+        trace_cls(x=xs, y=resistencia_line, mode='lines', name='Resistencia', line=dict(color='red', dash='dot')),
+    ]
+
+    # Añadir SMAs al gráfico
+    if len(_data) >= long_sma_window: 
+        sma_short_line = _sma(_data, data_key, short_sma_window)
+        sma_long_line = _sma(_data, data_key, long_sma_window)
+        traces.append(trace_cls(x=xs, y=sma_short_line, mode='lines', name=f'SMA {short_sma_window}', line=dict(color='purple', dash='solid')))
+        traces.append(trace_cls(x=xs, y=sma_long_line, mode='lines', name=f'SMA {long_sma_window}', line=dict(color='brown', dash='dash')))
+
+    fig = go.Figure(data=traces)
+
+    # Añadir líneas de alerta: todas las líneas y sus textos en una sola actualización del layout
+    hlines = ((target_value, "dot", "purple", f"Objetivo: {target_value:.2f}", 1, "right", "bottom"),) + ALERT_HLINES
+    shapes = [dict(type='line', xref='x domain', x0=0, x1=1, yref='y', y0=y, y1=y, line=dict(dash=dash, color=color))
+              for y, dash, color, _, _, _, _ in hlines]
+    annotations = [dict(xref='x domain', x=x, yref='y', y=y, text=texto, showarrow=False, xanchor=xanchor, yanchor=yanchor)
+                   for y, _, _, texto, x, xanchor, yanchor in hlines]
+
+    fig.update_layout(
+        shapes=shapes,
+        annotations=annotations,
+        title='Historial de Precios, Niveles S/R y Tendencias',
+        xaxis_title='Puntos de Datos',
+        yaxis_title='Valor',
+        height=500,
+        hovermode="x unified"
+    )
+
+    return fig.to_dict()
+
 # --- Configuración de la Página Streamlit ---
 st.set_page_config(
     page_title="Predicción de Trading Avanzada",
@@ -151,26 +375,72 @@ También te alerta sobre coeficientes altos.
 # --- Entrada de Datos del Usuario ---
 st.sidebar.header("⚙️ Configuración y Datos")
 
-datos_input_str = st.sidebar.text_area(
-    "**Ingresa tus valores numéricos históricos (separados por comas):**",
-    value="1.45, 1.48, 1.52, 1.49, 1.51, 1.47, 1.53, 1.46, 1.50, 1.49, 1.51, 1.52, 1.50, 1.48, 1.47, 1.49, 1.51, 1.50, 2.10, 3.50, 5.20, 9.80, 10.10",
-    height=180, 
-    help="Introduce una serie de números que representen los precios del activo. El teclado numérico de tu teléfono se debería desplegar automáticamente."
-)
-
-# --- Botón de Predicción (MOVIMIENTO) ---
-if st.sidebar.button("✨ Realizar Predicción Avanzada"):
+# Todos los controles de la barra lateral van en un formulario: cambiar datos o parámetros
+# no re-ejecuta la app; solo el botón de predicción lo hace, con todos los valores a la vez
+with st.sidebar.form("params", clear_on_submit=False):
+    datos_input_str = st.text_area(
+        "**Ingresa tus valores numéricos históricos (separados por comas):**",
+        value="1.45, 1.48, 1.52, 1.49, 1.51, 1.47, 1.53, 1.46, 1.50, 1.49, 1.51, 1.52, 1.50, 1.48, 1.47, 1.49, 1.51, 1.50, 2.10, 3.50, 5.20, 9.80, 10.10",
+        height=180, 
+        help="Introduce una serie de números que representen los precios del activo. El teclado numérico de tu teléfono se debería desplegar automáticamente."
+    )
+
+    # --- Botón de Predicción (MOVIMIENTO) ---
+    submitted = st.form_submit_button("✨ Realizar Predicción Avanzada")
+
+    # --- Sliders para parámetros ---
+    st.markdown("---") # Divisor para separar
+    st.header("📊 Parámetros de Análisis") # Nuevo subtítulo
+
+    # Para mantener los valores de los sliders después de la predicción, usamos st.session_state
+    # (el formulario los guarda ahí al enviarse)
+    st.number_input(
+        "**Valor Objetivo para la Predicción (ej. 1.50):**",
+        min_value=0.01, max_value=100.0, value=1.50, step=0.01,
+        key='target_value', # Usar key para session_state
+        help="El valor contra el cual se compara la predicción (mayor o menor)."
+    )
+
+    st.slider(
+        "**Tamaño Ventana Móvil (S/R):**",
+        min_value=1, max_value=50, value=10, step=1, 
+        key='window_size', # Usar key para session_state
+        help="Número de puntos para calcular S/R. Se ajusta dinámicamente si hay menos datos."
+    )
+
+    st.slider(
+        "**Umbral de Sensibilidad (Margen S/R):**",
+        min_value=0.001, max_value=0.1, value=0.01, format="%.3f", step=0.001,
+        key='threshold', # Usar key para session_state
+        help="Define qué tan cerca debe estar el precio de S/R para activar una predicción."
+    )
+
+    st.markdown("---")
+    st.header("📈 Configuración de Tendencia")
+    st.slider(
+        "**Ventana SMA Corta (Tendencia):**",
+        min_value=2, max_value=20, value=5, step=1,
+        key='short_sma', # Usar key para session_state
+        help="Número de puntos para la Media Móvil Simple (SMA) corta."
+    )
+    st.slider(
+        "**Ventana SMA Larga (Tendencia):**",
+        min_value=5, max_value=50, value=20, step=1,
+        key='long_sma', # Usar key para session_state
+        help="Número de puntos para la Media Móvil Simple (SMA) larga (debe ser mayor que la corta)."
+    )
+
+# --- Predicción (al enviar el formulario) ---
+if submitted:
     if not datos_input_str:
         st.error("Por favor, ingresa los valores numéricos para poder realizar la predicción.")
     else:
         try:
-            datos_numericos = [float(x.strip()) for x in datos_input_str.split(',') if x.strip()]
+            datos_numericos, datos_key = _parse_series(datos_input_str)
             
-            if not datos_numericos:
+            if datos_numericos.size == 0:
                 st.error("No se detectaron números válidos en la entrada. Revisa el formato.")
             else:
-                data_series = pd.Series(datos_numericos)
-                
                 # Obtener parámetros de los sliders
                 target_value_sidebar = st.session_state.get('target_value', 1.50) # Usar session_state para mantener valores
                 window_size_sidebar = st.session_state.get('window_size', 10)
@@ -179,135 +449,72 @@ if st.sidebar.button("✨ Realizar Predicción Avanzada"):
                 long_sma_sidebar = st.session_state.get('long_sma', 20)
 
                 # Realizar la predicción y obtener todos los resultados
-                results = get_prediction_and_alerts(data_series, target_value_sidebar, window_size_sidebar, 
-                                                    threshold_sidebar, short_sma_sidebar, long_sma_sidebar)
+                results = _prediction_cached(datos_numericos, datos_key, target_value_sidebar, window_size_sidebar,
+                                             threshold_sidebar, short_sma_sidebar, long_sma_sidebar)
                 
                 # --- ORDEN DE APARICIÓN EN EL CUERPO PRINCIPAL ---
                 
                 # 1. Predicción S/R Principal
                 st.subheader("🎯 Predicción S/R Principal")
-                if "PREDICCIÓN: Mayor" in results["prediction_sr_message"]:
-                    st.success(results["prediction_sr_message"])
-                elif "PREDICCIÓN: Menor" in results["prediction_sr_message"]:
-                    st.error(results["prediction_sr_message"])
-                else: # Incluye "INCIERTA" y "Insuficientes datos o S/R no calculable"
-                    st.warning(results["prediction_sr_message"])
+                if "MAYOR" in results.prediction_sr_message:
+                    st.success(results.prediction_sr_message)
+                elif "MENOR" in results.prediction_sr_message:
+                    st.error(results.prediction_sr_message)
+                else: # Incluye "INCIERTA"
+                    st.warning(results.prediction_sr_message)
+
+                # 2-6. El resto del informe va en un único bloque markdown: cada mensaje es un
+                # par (nivel, texto) y el nivel se muestra con el color de texto de Streamlit
+                informe = []
 
                 # 2. Alerta 2.0 (si existe)
-                if results["alert_2_0_message"]:
-                    if "🟢" in results["alert_2_0_message"]:
-                        st.success(results["alert_2_0_message"])
-                    elif "🔵" in results["alert_2_0_message"]:
-                        st.info(results["alert_2_0_message"])
+                if results.alert_2_0_message:
+                    if "🟢" in results.alert_2_0_message:
+                        informe.append(("success", results.alert_2_0_message))
+                    elif "🔵" in results.alert_2_0_message:
+                        informe.append(("info", results.alert_2_0_message))
 
                 # 3. Análisis Actual (Detalles del Valor Actual, S/R)
-                st.subheader("📊 Análisis Actual")
-                st.write(f"**Valor actual:** `{results['analysis_current']['actual']:.4f}`")
-                st.info(f"**Soporte detectado:** `{results['analysis_current']['soporte']:.4f}`")
-                st.info(f"**Resistencia detectada:** `{results['analysis_current']['resistencia']:.4f}`")
-                st.write(f"**Valor Objetivo de Comparación:** `{results['analysis_current']['target']:.4f}`")
-                st.write(f"**Umbral de sensibilidad:** `{results['analysis_current']['umbral']:.4f}`")
+                analisis = results.analysis_current
+                # Los cinco valores se formatean de una vez con `np.char.mod`
+                valores = np.char.mod(VALUE_FMT, np.array([analisis[k] for k in ANALYSIS_FIELDS], dtype=np.float64))
+                informe.append((None, "### 📊 Análisis Actual"))
+                informe += [(None, f"**{etiqueta}:** `{valor}`") for etiqueta, valor in zip(ANALYSIS_LABELS, valores)]
 
                 # 4. Alertas de 5.00 y 10.00
-                if results["alert_10_0_message"]:
-                    st.error(results["alert_10_0_message"])
-                if results["alert_5_0_message"]:
-                    st.error(results["alert_5_0_message"]) # Ya está ajustado en la función para no duplicar
+                if results.alert_10_0_message:
+                    informe.append(("error", results.alert_10_0_message))
+                if results.alert_5_0_message:
+                    informe.append(("error", results.alert_5_0_message)) # Ya está ajustado en la función para no duplicar
 
                 # 5. Análisis y Alertas de Tendencia
-                st.subheader("📈 Análisis de Tendencia")
-                if "ALCISTA" in results["tendency_message"]:
-                    st.success(results["tendency_message"])
-                elif "BAJISTA" in results["tendency_message"]:
-                    st.error(results["tendency_message"])
-                elif "ESTABLE" in results["tendency_message"]:
-                    st.info(results["tendency_message"])
+                informe.append((None, "### 📈 Análisis de Tendencia"))
+                if "ALCISTA" in results.tendency_message:
+                    informe.append(("success", results.tendency_message))
+                elif "BAJISTA" in results.tendency_message:
+                    informe.append(("error", results.tendency_message))
+                elif "ESTABLE" in results.tendency_message:
+                    informe.append(("info", results.tendency_message))
                 else:
-                    st.warning(results["tendency_message"])
+                    informe.append(("warning", results.tendency_message))
                 
                 # 6. Advertencias generales que no encajan en las categorías anteriores
-                for warning_msg in results["warnings"]:
-                    st.warning(warning_msg)
+                informe += [("warning", warning_msg) for warning_msg in results.warnings]
+
+                st.markdown("\n\n".join(
+                    f":{MESSAGE_COLORS[nivel]}[{texto}]" if nivel else texto for nivel, texto in informe
+                ))
 
 
                 # --- Visualización de Datos y S/R ---
                 st.subheader("📈 Gráfico de Precios con Soporte, Resistencia y Tendencias")
                 
-                plot_window_for_sr = max(1, min(window_size_sidebar, len(data_series)))
-                soporte_line, resistencia_line = detectar_soporte_resistencia(data_series, plot_window_for_sr)
-
-                fig = go.Figure()
-                fig.add_trace(go.Scatter(x=list(range(len(data_series))), y=data_series, mode='lines+markers', name='Precios', line=dict(color='blue')))
-                fig.add_trace(go.Scatter(x=list(range(len(soporte_line))), y=soporte_line, mode='lines', name='Soporte', line=dict(color='green', dash='dot')))
-                fig.add_trace(go.Scatter(x=list(range(len(resistencia_line))), y=resistencia_line, mode='lines', name='Resistencia', line=dict(color='red', dash='dot')))
-                
-                # Añadir SMAs al gráfico
-                if len(data_series) >= long_sma_sidebar: 
-                    sma_short_line = data_series.rolling(window=short_sma_sidebar, min_periods=1).mean()
-                    sma_long_line = data_series.rolling(window=long_sma_sidebar, min_periods=1).mean()
-                    fig.add_trace(go.Scatter(x=list(range(len(sma_short_line))), y=sma_short_line, mode='lines', name=f'SMA {short_sma_sidebar}', line=dict(color='purple', dash='solid')))
-                    fig.add_trace(go.Scatter(x=list(range(len(sma_long_line))), y=sma_long_line, mode='lines', name=f'SMA {long_sma_sidebar}', line=dict(color='brown', dash='dash')))
-
-                # Añadir líneas de alerta
-                fig.add_hline(y=target_value_sidebar, line_dash="dot", line_color="purple", annotation_text=f"Objetivo: {target_value_sidebar:.2f}", annotation_position="top right")
-                fig.add_hline(y=2.00, line_dash="dot", line_color="blue", annotation_text="Alerta 2.00", annotation_position="top left") 
-                fig.add_hline(y=5.00, line_dash="dash", line_color="orange", annotation_text="Alerta 5.00", annotation_position="bottom right")
-                fig.add_hline(y=10.00, line_dash="dashdot", line_color="red", annotation_text="Alerta 10.00", annotation_position="top left")
-
-
-                fig.update_layout(
-                    title='Historial de Precios, Niveles S/R y Tendencias',
-                    xaxis_title='Puntos de Datos',
-                    yaxis_title='Valor',
-                    height=500,
-                    hovermode="x unified"
-                )
+                fig = build_fig(datos_numericos, datos_key, results.adjusted_window, target_value_sidebar,
+                                short_sma_sidebar, long_sma_sidebar)
                 st.plotly_chart(fig, use_container_width=True)
 
         except ValueError:
             st.error("Error: Por favor, asegúrate de que los datos ingresados sean solo números válidos separados por comas.")
 
-# --- Sliders para parámetros ---
-st.sidebar.markdown("---") # Divisor para separar
-st.sidebar.header("📊 Parámetros de Análisis") # Nuevo subtítulo
-
-# Para mantener los valores de los sliders después de la predicción, usamos st.session_state
-# Esto es importante porque el botón en la sidebar redibuja toda la app
-st.sidebar.number_input(
-    "**Valor Objetivo para la Predicción (ej. 1.50):**",
-    min_value=0.01, max_value=100.0, value=1.50, step=0.01,
-    key='target_value', # Usar key para session_state
-    help="El valor contra el cual se compara la predicción (mayor o menor)."
-)
-
-st.sidebar.slider(
-    "**Tamaño Ventana Móvil (S/R):**",
-    min_value=1, max_value=50, value=10, step=1, 
-    key='window_size', # Usar key para session_state
-    help="Número de puntos para calcular S/R. Se ajusta dinámicamente si hay menos datos."
-)
-
-st.sidebar.slider(
-    "**Umbral de Sensibilidad (Margen S/R):**",
-    min_value=0.001, max_value=0.1, value=0.01, format="%.3f", step=0.001,
-    key='threshold', # Usar key para session_state
-    help="Define qué tan cerca debe estar el precio de S/R para activar una predicción."
-)
-
-st.sidebar.markdown("---")
-st.sidebar.header("📈 Configuración de Tendencia")
-st.sidebar.slider(
-    "**Ventana SMA Corta (Tendencia):**",
-    min_value=2, max_value=20, value=5, step=1,
-    key='short_sma', # Usar key para session_state
-    help="Número de puntos para la Media Móvil Simple (SMA) corta."
-)
-st.sidebar.slider(
-    "**Ventana SMA Larga (Tendencia):**",
-    min_value=5, max_value=50, value=20, step=1,
-    key='long_sma', # Usar key para session_state
-    help="Número de puntos para la Media Móvil Simple (SMA) larga (debe ser mayor que la corta)."
-)
-
 st.markdown("---")
 st.caption("Desarrollado con Streamlit por tu AI asistente.")
@@ -0,0 +1,29 @@
+# Compila AOT los kernels de `kernels.py` en el módulo de extensión `trading_kernels`,
+# junto a `app.py`. Ejecutar en el paso de build/deploy:
+#
+#     python build_kernels.py
+#
+# Hay que volver a ejecutarlo cada vez que cambie `kernels.py`: el módulo guarda la huella
+# del fichero (`source_hash`) y, si no coincide, `kernels.py` lo ignora y recurre al JIT de
+# Numba (más lento solo al arrancar), igual que si el módulo no existiera.
+import os
+
+from numba.pycc import CC
+
+import kernels
+
+cc = CC('trading_kernels')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+for name, (kernel, signature) in kernels.AOT_EXPORTS.items():
+    cc.export(name, signature)(kernel.py_func)
+
+SOURCE_HASH = kernels.SOURCE_HASH
+
+@cc.export('source_hash', 'i8()')
+def source_hash():
+    # Constante congelada al compilar: identifica la versión de `kernels.py` compilada
+    return SOURCE_HASH
+
+if __name__ == '__main__':
+    cc.compile()
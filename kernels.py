@@ -0,0 +1,191 @@
+# Kernels numéricos compilados con Numba.
+# Viven en un módulo aparte porque Streamlit re-ejecuta `app.py` en cada interacción:
+# al importarse, el módulo queda en `sys.modules` y los kernels se compilan una sola vez
+# por proceso (y `cache=True` reutiliza el código máquina entre procesos).
+import hashlib
+import warnings
+
+import numpy as np
+from numba import njit, prange
+
+# Precisión de los precios, la misma para las decisiones y para el gráfico. En float32 los
+# decimales no coinciden con los de la entrada y cambian los empates exactos de la predicción
+# (1.31 + 0.02 vs 1.33); y convertir a float32 solo para el gráfico cuesta una pasada extra
+# que se come el ahorro de ancho de banda de los kernels.
+PRICE_DTYPE = np.float64
+
+@njit(cache=True)
+def _rolling_minmax_into(a, w, min_periods, mn, mx):
+    """Núcleo de `rolling_minmax`: escribe el resultado en `mn` y `mx`."""
+    n = a.shape[0]
+    cap = min(w, n) + 1 # Como mucho la ventana completa más el índice recién llegado
+    qn_i = np.empty(cap, np.int64)
+    qn_h = 0
+    qn_t = 0
+    qx_i = np.empty(cap, np.int64)
+    qx_h = 0
+    qx_t = 0
+    warmup = min(min_periods - 1, n)
+    mn[:warmup] = np.nan
+    mx[:warmup] = np.nan
+    for i in range(n):
+        while qn_t > qn_h and a[qn_i[(qn_t - 1) % cap]] >= a[i]:
+            qn_t -= 1
+        qn_i[qn_t % cap] = i
+        qn_t += 1
+        while qx_t > qx_h and a[qx_i[(qx_t - 1) % cap]] <= a[i]:
+            qx_t -= 1
+        qx_i[qx_t % cap] = i
+        qx_t += 1
+        if i < warmup:
+            continue # Sin datos suficientes: solo se llenan las deques (nada puede caducar aún)
+        if qn_i[qn_h % cap] <= i - w:
+            qn_h += 1
+        if qx_i[qx_h % cap] <= i - w:
+            qx_h += 1
+        mn[i] = a[qn_i[qn_h % cap]]
+        mx[i] = a[qx_i[qx_h % cap]]
+
+@njit(cache=True)
+def rolling_minmax(a, w, min_periods):
+    """
+    Mínimo y máximo móviles en una sola pasada (deques monotónicas ascendente/descendente).
+    Cada lectura de `a[i]` sirve a ambas salidas. Como en pandas, las primeras
+    `min_periods - 1` posiciones quedan en NaN (`1 <= min_periods <= w`); con
+    `min_periods=w` solo hay valor con la ventana completa.
+    Las deques son buffers circulares de `w + 1` índices: el único tráfico proporcional a
+    `n` es la lectura de `a` y la escritura de las dos salidas.
+    """
+    mn = np.empty_like(a)
+    mx = np.empty_like(a)
+    _rolling_minmax_into(a, w, min_periods, mn, mx)
+    return mn, mx
+
+@njit(parallel=True, nogil=True, cache=True)
+def rolling_minmax_table(a, w, min_periods):
+    """
+    Versión por tabla de `rolling_minmax` para una matriz (n, k) con una serie por columna.
+    Las columnas son independientes y se reparten entre núcleos con `prange`.
+    """
+    mn = np.empty_like(a)
+    mx = np.empty_like(a)
+    for col in prange(a.shape[1]):
+        _rolling_minmax_into(a[:, col], w, min_periods, mn[:, col], mx[:, col])
+    return mn, mx
+
+@njit(cache=True)
+def rolling_mean_online(a, w, min_periods):
+    """
+    Media móvil simple online: en cada paso suma el valor que entra y resta el que sale
+    de la ventana (O(1) por punto). Las primeras `min_periods - 1` posiciones quedan en NaN,
+    con la misma convención que `rolling_minmax`.
+    """
+    n = a.shape[0]
+    out = np.empty(n, np.float64)
+    running_sum = 0.0
+    nobs = 0
+    for i in range(n):
+        running_sum += a[i]
+        nobs += 1
+        if i >= w:
+            running_sum -= a[i - w]
+            nobs -= 1
+        out[i] = running_sum / nobs
+    out[:min(min_periods - 1, n)] = np.nan
+    return out
+
+@njit(inline='always')
+def _neumaier_add(total, comp, v):
+    """Suma compensada (Kahan-Neumaier): devuelve el nuevo total y el error acumulado."""
+    t = total + v
+    if abs(total) >= abs(v):
+        comp += (total - t) + v
+    else:
+        comp += (v - t) + total
+    return t, comp
+
+@njit(cache=True)
+def fused_last(a, w, w_s, w_l):
+    """
+    Valores del último punto en un solo recorrido de la cola: soporte y resistencia
+    (mínimo/máximo de las últimas `w` muestras), SMA corta y larga (medias de las últimas
+    `w_s` y `w_l`) y el valor actual. Las ventanas mayores que la serie usan la serie completa.
+    Las sumas de las SMAs son compensadas: los empates exactos entre precio y SMAs (frecuentes
+    con decimales de 2 cifras) se resuelven con la media correctamente redondeada y no
+    dependen del orden de la suma. Sin `fastmath`, que eliminaría la compensación.
+    
+    Returns:
+        tuple: (soporte, resistencia, sma_corta, sma_larga, actual).
+    """
+    n = a.shape[0]
+    w = min(w, n)
+    w_s = min(w_s, n)
+    w_l = min(w_l, n)
+    actual = a[n - 1]
+    mn = actual
+    mx = actual
+    sum_s = 0.0
+    comp_s = 0.0
+    sum_l = 0.0
+    comp_l = 0.0
+    # Se recorre la cola de atrás hacia delante: la muestra a distancia `k` del final
+    # pertenece a cada ventana con `k < ventana`
+    for k in range(max(w, max(w_s, w_l))):
+        v = a[n - 1 - k]
+        if k < w:
+            mn = min(mn, v)
+            mx = max(mx, v)
+        if k < w_s:
+            sum_s, comp_s = _neumaier_add(sum_s, comp_s, v)
+        if k < w_l:
+            sum_l, comp_l = _neumaier_add(sum_l, comp_l, v)
+    return mn, mx, (sum_s + comp_s) / w_s, (sum_l + comp_l) / w_l, actual
+
+# Kernels que `build_kernels.py` compila AOT, con su firma para PRICE_DTYPE (float64).
+# Se exportan con nombre privado: el código AOT no comprueba los argumentos (un array de
+# otro dtype o una lista tumban el proceso), así que solo se llaman desde los envoltorios
+# de más abajo, que los convierten antes.
+AOT_EXPORTS = {
+    '_rolling_minmax': (rolling_minmax, 'UniTuple(f8[:], 2)(f8[:], i8, i8)'),
+    '_rolling_mean_online': (rolling_mean_online, 'f8[:](f8[:], i8, i8)'),
+    '_fused_last': (fused_last, 'UniTuple(f8, 5)(f8[:], i8, i8, i8)'),
+}
+
+# Huella de este fichero (con finales de línea normalizados). `build_kernels.py` la graba en
+# `trading_kernels` y aquí se compara: un módulo compilado con otra versión de los kernels
+# (p. ej. otra convención de `min_periods`) se ignora en lugar de usarse sin avisar.
+with open(__file__, 'rb') as _f:
+    SOURCE_HASH = int.from_bytes(
+        hashlib.blake2b(_f.read().replace(b'\r\n', b'\n'), digest_size=8).digest(), 'little', signed=True)
+
+def _aot_module():
+    """Módulo AOT `trading_kernels` si existe y se compiló desde este `kernels.py`; si no, None."""
+    try:
+        import trading_kernels
+    except ImportError:
+        return None
+    source_hash = getattr(trading_kernels, 'source_hash', None)
+    if source_hash is None or source_hash() != SOURCE_HASH:
+        warnings.warn("trading_kernels no corresponde a kernels.py; se usan los kernels JIT. "
+                      "Vuelve a ejecutar `python build_kernels.py`.")
+        return None
+    return trading_kernels
+
+_aot = _aot_module()
+if _aot is not None:
+    # Módulo AOT generado en el build: ni JIT ni carga de caché al arrancar el proceso.
+    # Los envoltorios mantienen el contrato del JIT: aceptan cualquier secuencia numérica.
+    def rolling_minmax(a, w, min_periods):
+        return _aot._rolling_minmax(np.ascontiguousarray(a, dtype=PRICE_DTYPE), int(w), int(min_periods))
+
+    def rolling_mean_online(a, w, min_periods):
+        return _aot._rolling_mean_online(np.ascontiguousarray(a, dtype=PRICE_DTYPE), int(w), int(min_periods))
+
+    def fused_last(a, w, w_s, w_l):
+        return _aot._fused_last(np.ascontiguousarray(a, dtype=PRICE_DTYPE), int(w), int(w_s), int(w_l))
+else:
+    # Sin módulo AOT (o desactualizado): compilación anticipada con el JIT, así el primer clic no la paga.
+    # `rolling_minmax_table` no la usa la app todavía y se compila en su primera llamada.
+    rolling_minmax(np.zeros(2, PRICE_DTYPE), 1, 1)
+    rolling_mean_online(np.zeros(2, PRICE_DTYPE), 1, 1)
+    fused_last(np.zeros(2, PRICE_DTYPE), 1, 1, 1)